@@ -1,15 +1,17 @@
 import streamlit as st
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import plotly.express as px
-from order_prediction_sql import get_db_connection, load_data, generate_prediction_for_record
+from order_prediction_sql import load_data, build_prediction_context, generate_prediction_for_record
 import os
 from dotenv import load_dotenv
 import pyodbc
-import xmltodict
+import xml.etree.ElementTree as ET
 import re
 import json
+import threading
 import logging
-from nl_to_sql import prepare_schema_context, nl_to_sql, execute_sql_query, execute_query_with_user_feedback
+from nl_to_sql import prepare_schema_context, clear_schema_cache, nl_to_sql, execute_sql_query, execute_query_with_user_feedback
 
 # Configure logging
 logging.basicConfig(
@@ -33,441 +35,276 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for better UI
-st.markdown("""
-    <style>
-    /* Modern, minimal UI styling */
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
+# Custom CSS for better UI, kept in a static stylesheet
+CSS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'app.css')
 
-/* Global styles */
-html, body, [class*="st-"] {
-    font-family: 'Inter', sans-serif;
-    color: #DCDCDC;
-}
-
-.stApp {
-    background-color: white;
-}
-
-/* Main container */
-.main .block-container {
-    padding-top: 1.5rem;
-    padding-bottom: 1.5rem;
-    max-width: 100%;
-}
-
-/* Headers */
-h1, h2, h3, h4, h5, h6 {
-    font-weight: 600;
-    color: #1a1a1a;
-    margin-bottom: 0.5rem;
-}
-
-h1 {
-    font-size: 2rem;
-    margin-bottom: 1.5rem;
-}
-
-h2 {
-    font-size: 1.5rem;
-    margin-bottom: 1rem;
-}
-
-h3 {
-    font-size: 1.2rem;
-    margin-bottom: 0.75rem;
-}
-
-/* Sidebar styles */
-section[data-testid="stSidebar"] {
-    background-color: #f8fafc;
-}
-
-/* Search input styling */
-.stTextInput>div>div>input {
-    border-radius: 4px;
-    border: 1px solid #e2e8f0;
-    padding: 0.5rem 1rem;
-    font-size: 1rem;
-    background-color: white !important;
-    color: #333 !important;
-}
-
-/* Search container */
-.search-container {
-    max-width: 300px;
-    margin: 1rem 0 1.5rem auto;
-}
-
-/* Table styling */
-.table-container {
-    border: 1px solid #e2e8f0;
-    border-radius: 8px;
-    overflow: hidden;
-    margin-bottom: 1.5rem;
-}
-
-.table-header {
-    background-color: #f8fafc;
-    padding: 0.75rem 1rem;
-    font-weight: 600;
-    border-bottom: 1px solid #e2e8f0;
-    border-right: 1px solid #e2e8f0;
-    white-space: nowrap;
-    overflow: hidden;
-    text-overflow: ellipsis;
-}
-
-.table-row {
-    padding: 0.75rem 0;
-    border-bottom: 1px solid #f1f5f9;
-    transition: background-color 0.2s ease;
-}
-
-.table-row:hover {
-    background-color: #f8fafc;
-}
-
-.table-row:last-child {
-    border-bottom: none;
-}
 
-/* Table cell styling for better display */
-.table-row p {
-    padding: 0.75rem 1rem;
-    margin: 0;
-    border-right: 1px solid #e2e8f0;
-    white-space: nowrap;
-    overflow: hidden;
-    text-overflow: ellipsis;
-}
-
-/* Column sizing and layout */
-.st-ci {
-    overflow: hidden;
-    border-right: 1px solid #e2e8f0;
-}
+def minify_css(css):
+    """Strip comments and collapse whitespace in a stylesheet"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).strip()
 
-/* Dataframe styling for proper data display */
-.stDataFrame {
-    border-radius: 8px;
-    overflow: hidden;
-    box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-}
 
-/* Prediction section */
-.prediction-card {
-    background-color: #fff;
-    border-radius: 8px;
-    margin-top: 1rem;
-    border: 1px solid #e2e8f0;
-    box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-    overflow: hidden;
-    display: flex;
-    flex-direction: column;
-}
+@st.cache_resource(show_spinner=False)
+def load_css_markup():
+    """Read and minify the stylesheet once per process"""
+    # This script re-executes on every rerun, so the read is cached rather than module-level
+    with open(CSS_FILE, encoding='utf-8') as css_file:
+        return f"<style>{minify_css(css_file.read())}</style>"
 
-.prediction-header {
-    font-size: 1.2rem;
-    font-weight: 600;
-    color: #1a1a1a;
-    padding: 0.75rem 1.25rem;
-    background-color: #f8fafc;
-    border-bottom: 1px solid #e2e8f0;
-}
 
-.prediction-content {
-    padding: 1.25rem;
-    background-color: #fff;
-}
+# Streamlit drops any element a rerun does not emit again, so the styles are
+# re-sent on every run; only the cached, minified markup is sent
+st.markdown(load_css_markup(), unsafe_allow_html=True)
 
-.prediction-content p {
-    margin-bottom: 0.75rem;
-    color: #1a1a1a;
-    font-size: 1rem;
-    line-height: 1.5;
-}
 
-.prediction-content p:last-child {
-    margin-bottom: 0;
+# key=value pairs of a connection string, tokenized in a single pass
+_CONN_STR_PAIR_RE = re.compile(r'([^=;]+)=([^;]*)')
+_CONN_STR_KEYS = {
+    'data source': 'server',
+    'initial catalog': 'database',
+    'user id': 'username',
+    'password': 'password'
 }
 
-/* Status indicator */
-.status {
-    padding: 0.25rem 0.5rem;
-    border-radius: 4px;
-    font-size: 0.85rem;
-    display: inline-block;
-    font-weight: 500;
-    background-color: #e6f7ed;
-    color: #0a7b3e;
-}
-
-/* Transitions and animations */
-.stButton>button, .stTextInput>div>div>input, .stSelectbox>div>div {
-    transition: all 0.2s ease;
-}
-
-.stButton>button:hover {
-    transform: translateY(-1px);
-    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-}
-
-/* ----- START TEXT AREA FIX ----- */
-/* Style for st.text_area */
-.stTextArea textarea {
-    border-radius: 4px;
-    border: 1px solid #e2e8f0;
-    padding: 0.5rem 1rem;
-    font-size: 1rem;
-    background-color: white !important; /* White background */
-    color: #333 !important; /* Dark text color */
-    min-height: 100px; /* Ensure a minimum height */
-}
 
-/* Placeholder color for text area */
-.stTextArea textarea::placeholder {
-    color: #a0aec0 !important; /* Lighter placeholder text */
-}
-/* ----- END TEXT AREA FIX ----- */
-
-
-/* Dropdown styling */
-.stSelectbox>div>div {
-    border-radius: 4px;
-    border: 1px solid #e2e8f0;
-    background-color: white !important;
-}
-
-.stSelectbox select {
-    background-color: white !important;
-}
-
-/* Fix for dropdown background */
-div[data-baseweb="select"] {
-    background-color: white !important;
-}
-
-div[data-baseweb="select"] * {
-    background-color: white !important;
-}
-
-/* Update select box text color to ensure visibility */
-div[data-baseweb="select"] span {
-    color: #333 !important;
-}
-
-/* Fix for dropdown menu items */
-div[data-baseweb="popover"] * {
-    background-color: white !important;
-    color: #333 !important;
-}
-
-/* Fix for dropdown list items */
-div[data-baseweb="menu"] {
-    background-color: white !important;
-}
-
-div[data-baseweb="menu"] div[role="option"] {
-    background-color: white !important;
-    color: #333 !important;
-}
-
-/* Fix hover state on dropdown options */
-div[data-baseweb="menu"] div[role="option"]:hover {
-    background-color: #f1f5f9 !important;
-}
-
-/* Ensure dropdown selected value is visible */
-div[data-testid="stSelectbox"] div[data-baseweb="select"] div {
-    color: #333 !important;
-}
-
-/* Card styling */
-.card {
-    background-color: white;
-    border-radius: 8px;
-    padding: 1.25rem;
-    border: 1px solid #e2e8f0;
-    margin-bottom: 1rem;
-    transition: box-shadow 0.2s ease;
-}
-
-.card:hover {
-    box-shadow: 0 4px 6px rgba(0,0,0,0.05);
-}
+def parse_connection_string(conn_str):
+    """Parse SQL Server connection string into components"""
+    try:
+        # Keep the first occurrence of each key; values are never searched for keys
+        pairs = {}
+        for key, value in _CONN_STR_PAIR_RE.findall(conn_str):
+            pairs.setdefault(key.strip().lower(), value.strip())
 
-/* Fixed button styling */
-.stButton > button {
-    background-color: #4263eb !important;
-    color: white !important;
-}
+        return {field: pairs.get(key) or None for key, field in _CONN_STR_KEYS.items()}
+    except Exception as e:
+        st.error(f"Error parsing connection string: {str(e)}")
+        return None
 
-/* Select button styling */
-.table-row .stButton > button, td .stButton > button {
-    background-color: #f8fafc !important;
-    color: #1a1a1a !important;
-    border: 1px solid #e2e8f0 !important;
-}
 
-.table-row .stButton > button:hover, td .stButton > button:hover {
-    background-color: #f1f5f9 !important;
-}
+CONFIG_FILE = 'dataaccessconfig.xml'
 
-.stSelectbox p, .stSelectbox > div > div > div {
-    color: #333 !important;
-}
+@st.cache_data(ttl=3600, show_spinner=False)
+def parse_company_config(mtime):
+    """Parse the company configuration XML file; mtime only keys the cache so edits are picked up"""
+    # The config is a flat list of <Company> elements, so stream it with iterparse
+    # rather than materializing the whole tree
+    companies = {}
 
-/* Primary buttons styling */
-button[kind="primary"] {
-    background-color: #4263eb !important;
-    color: white !important;
-}
+    for _, company in ET.iterparse(CONFIG_FILE):
+        if company.tag != 'Company':
+            continue
+        # Use the new ServerName format instead of ConnectionString
+        server_name = (company.findtext('ServerName') or '').strip()
 
-/* Secondary buttons styling */
-.stButton > button[kind="secondary"], .stButton > button[data-testid="baseButton-secondary"] {
-    background-color: #f8fafc !important;
-    color: #1a1a1a !important;
-    border: 1px solid #e2e8f0 !important;
-}
+        # If the old format is still used, try to parse it
+        conn_str = (company.findtext('ConnectionString') or '').strip()
+        if not server_name and conn_str:
+            conn_data = parse_connection_string(conn_str)
+            if conn_data:
+                server_name = conn_data['server']
 
-/* Ensure all text elements have proper contrast */
-p, h1, h2, h3, h4, h5, h6, span, div.row-widget.stButton, label {
-    color: #333 !important;
-}
+        if server_name:
+            # Handle both the new 'Name' and old 'n' formats for backward compatibility
+            company_name = (company.findtext('Name') or company.findtext('n') or '').strip()
+            # Keyed by name for O(1) lookups; the first entry wins for duplicate names
+            companies.setdefault(company_name, {
+                'name': company_name,
+                'server': server_name
+            })
 
-/* Table cell content color */
-.table-row p {
-    color: #333 !important;
-    margin: 0;
-}
+        # Each <Company> is fully read at its end event, so drop its children
+        company.clear()
 
-/* Input placeholder color */
-.stTextInput > div > div > input::placeholder {
-    color: #a0aec0 !important;
-}
-
-/* Additional table scrolling behavior */
-.st-cy {
-    overflow-x: auto !important; 
-}
-
-/* Button override to fix streamlit default styling */
-div.stButton button {
-    background-color: #f8fafc !important;
-    color: #1a1a1a !important;
-    border: 1px solid #e2e8f0 !important;
-}
-
-/* Primary buttons only */
-div.stButton button[kind="primary"] {
-    background-color: #4263eb !important;
-    color: white !important;
-}
-    </style>
-""", unsafe_allow_html=True)
-
-
-def parse_connection_string(conn_str):
-    """Parse SQL Server connection string into components"""
-    try:
-        # Extract server and database using regex
-        server_match = re.search(r'data source=([^;]+)', conn_str, re.IGNORECASE)
-        database_match = re.search(r'initial catalog=([^;]+)', conn_str, re.IGNORECASE)
-        user_match = re.search(r'User ID=([^;]+)', conn_str, re.IGNORECASE)
-        password_match = re.search(r'Password=([^;]+)', conn_str, re.IGNORECASE)
-
-        return {
-            'server': server_match.group(1) if server_match else None,
-            'database': database_match.group(1) if database_match else None,
-            'username': user_match.group(1) if user_match else None,
-            'password': password_match.group(1) if password_match else None
-        }
-    except Exception as e:
-        st.error(f"Error parsing connection string: {str(e)}")
-        return None
+    # Sorted once here so the cached result already has the dropdown order
+    return dict(sorted(companies.items()))
 
 
 def load_company_config():
-    """Load and parse the company configuration XML file"""
+    """Load the company configuration, returning (companies by name, error message)"""
     try:
-        with open('dataaccessconfig.xml', 'r') as file:
-            config = xmltodict.parse(file.read())
-            companies = []
-
-            for company in config['Config']['Company']:
-                # Use the new ServerName format instead of ConnectionString
-                server_name = company.get('ServerName', '')
-                
-                # If the old format is still used, try to parse it
-                if not server_name and company.get('ConnectionString'):
-                    conn_data = parse_connection_string(company.get('ConnectionString', ''))
-                    if conn_data:
-                        server_name = conn_data['server']
-
-                if server_name:
-                    # Handle both the new 'Name' and old 'n' formats for backward compatibility
-                    company_name = company.get('Name', '') or company.get('n', '')
-                    companies.append({
-                        'name': company_name,
-                        'server': server_name
-                    })
-
-            return companies
+        return parse_company_config(os.stat(CONFIG_FILE).st_mtime_ns), None
     except Exception as e:
-        st.error(f"Error loading company configuration: {str(e)}")
-        return []
+        return {}, f"Error loading company configuration: {str(e)}"
 
 
-def test_connection(server, database=None):
-    """Test connection to a SQL Server using Windows authentication"""
-    try:
-        # Only use the server name for the connection test
-        conn_str = f"DRIVER={{SQL Server}};SERVER={server};Trusted_Connection=yes"
-        
-        # If database is provided, include it in the connection string
-        if database:
-            conn_str += f";DATABASE={database}"
-            
-        conn = pyodbc.connect(conn_str, timeout=3)  # 3 second timeout
-        conn.close()
-        return True
-    except Exception as e:
-        logger.debug(f"Connection test failed: {e}")
-        return False
+# pyodbc connections must not be used by two threads at once, and each Streamlit
+# session runs on its own thread, so access to each shared connection is serialized
+@st.cache_resource(show_spinner=False)
+def get_server_lock(server):
+    """Return the lock guarding the shared connection for a server"""
+    return threading.Lock()
 
 
-def get_server_status(company):
-    """Get server status with HTML formatting"""
-    is_online = test_connection(company['server'])
-    status_class = "online" if is_online else "offline"
-    status_text = "Online" if is_online else "Offline"
-    return f'<div class="server-status {status_class}">{status_text}</div>'
+@st.cache_resource(show_spinner=False)
+def get_server_connection(server):
+    """Return a connection to a server that is shared across reruns and sessions"""
+    conn_str = f"DRIVER={{SQL Server}};SERVER={server};Trusted_Connection=yes"
+    # Only short catalog reads use this connection, so skip implicit transactions;
+    # the 3 second login timeout keeps probes of offline servers short
+    return pyodbc.connect(conn_str, autocommit=True, timeout=3)
 
 
-def get_databases(company):
-    """Get list of databases for the selected company using Windows authentication"""
+def run_server_query(server, query, *params):
+    """Run a query on the shared connection for a server and return all rows"""
     try:
-        conn_str = f"DRIVER={{SQL Server}};SERVER={company['server']};Trusted_Connection=yes"
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
-
-        # Get user databases (exclude system databases)
-        cursor.execute("""
-            SELECT name 
-            FROM sys.databases 
-            WHERE database_id > 4 
-                AND state = 0  -- Online databases only
-                AND is_read_only = 0  -- Exclude read-only databases
-            ORDER BY name
-        """)
-
-        databases = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return databases
-    except Exception as e:
-        st.error(f"Error fetching databases from {company['server']}: {str(e)}")
-        return []
+        with get_server_lock(server):
+            return get_server_connection(server).cursor().execute(query, *params).fetchall()
+    except pyodbc.Error:
+        # The connection may have dropped; forget it so the next call reconnects
+        get_server_connection.clear()
+        raise
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_databases(server):
+    """Get list of databases on a server using Windows authentication (cached for 5 minutes)"""
+    # Errors are raised rather than rendered so a failed lookup is never cached
+    # Get user databases (exclude system databases)
+    rows = run_server_query(server, """
+        SELECT name 
+        FROM sys.databases 
+        WHERE database_id > 4 
+            AND state = 0  -- Online databases only
+            AND is_read_only = 0  -- Exclude read-only databases
+        ORDER BY name
+    """)
+
+    return [name for name, in rows]
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_order_data(server, database):
+    """Load order data for a server and database (cached for 10 minutes)"""
+    # Raised rather than returned so an empty or failed load is never cached
+    df = load_data(server, database)
+    if df is None or df.empty:
+        raise ValueError("No data available. Check the logs for details.")
+    return df
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_schema_context(server, database):
+    """Describe a database's schema for NL to SQL prompts (cached for an hour)"""
+    # Raised rather than returned so a failed lookup is never cached
+    # nl_to_sql keeps its own cache for the per-query lookups; this one is independent
+    schema_context = prepare_schema_context(server, database, use_cache=False)
+    if not schema_context or schema_context.startswith("Error"):
+        raise ValueError("Could not fetch database schema. Check the logs for details.")
+    return schema_context
+
+
+def build_search_blob(df):
+    """Concatenate every column of each row into one lowercased string for searching"""
+    # The unit separator can't be typed into the search box, so matches never span columns
+    # Join the column arrays row by row instead of OR-ing/adding aligned Series per column
+    columns = [df[col].astype(str).fillna('').to_numpy(dtype=object) for col in df.columns]
+    blob = ['\x1f'.join(values).lower() + '\x1f' for values in zip(*columns)]
+    # Kept as an Arrow array so searches run as a single C++ substring kernel
+    return pa.array(blob, type=pa.large_string())
+
+
+# Strength formatting is applied by the frontend grid rather than a pandas Styler
+STRENGTH_FORMAT = st.column_config.NumberColumn(format='%.2f')
+ORDER_TABLE_COLUMN_CONFIG = {'ORDERSTRENGTH': STRENGTH_FORMAT, 'CUMULSTRENGTH': STRENGTH_FORMAT}
+# The action table relabels columns at render time instead of renaming a copy of the frame
+ACTION_TABLE_COLUMN_CONFIG = {
+    'ORDERNUMBER': st.column_config.Column('Order #'),
+    'INGRD_GRP_NM': st.column_config.Column('Ingredient Group'),
+    'ORDERSTRENGTH': st.column_config.NumberColumn('Order Str', format='%.2f'),
+    'CUMULSTRENGTH': st.column_config.NumberColumn('Cumul. Str', format='%.2f'),
+}
+# Pixel height of one grid row, used to size tables to their row count
+TABLE_ROW_HEIGHT = 35
+
+
+def table_height(row_count):
+    """Height in pixels that fits a header plus row_count rows without scrolling"""
+    return (row_count + 1) * TABLE_ROW_HEIGHT + 3
+
+
+# Session state entries derived from the loaded order data
+DERIVED_DATA_KEYS = ('search_blob', 'search_result', 'arrow_data', 'recent_records', 'action_columns',
+                     'recent_order_index', 'prediction_context')
+# Session state tied to rows of the loaded data, dropped whenever new data is loaded
+SELECTION_KEYS = ('selected_record', 'selected_record_idx', 'prediction', 'current_page', 'action_order_select')
+
+
+def store_loaded_data(df):
+    """Store loaded order data plus the views derived from it, so reruns don't rebuild them"""
+    # A selection, prediction or page from the previous data must not carry over to the new rows
+    for key in SELECTION_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state['data'] = df
+    st.session_state['search_blob'] = build_search_blob(df)
+    # Matches for the last search term, computed against the blob above
+    st.session_state['search_result'] = None
+    # Arrow copy used for table display, so pages are sliced without
+    # converting pandas to Arrow on every rerun
+    st.session_state['arrow_data'] = pa.Table.from_pandas(df, preserve_index=False)
+
+    # The 10 most recent records and the columns the action table shows from them
+    recent_records = df.tail(10)
+    trend_columns = [col for col in df.columns if 'TREND' in col]
+    display_cols = ['ORDERNUMBER', 'INGRD_GRP_NM', 'ORDERSTRENGTH', 'CUMULSTRENGTH'] + trend_columns
+    st.session_state['recent_records'] = recent_records
+    # Order number -> df index for the selectbox; reversed so the first occurrence wins
+    st.session_state['recent_order_index'] = dict(zip(
+        reversed(recent_records['ORDERNUMBER'].tolist()), reversed(recent_records.index.tolist())
+    ))
+    st.session_state['action_columns'] = display_cols
+    # Arrays the prediction prompt is built from, extracted once per load
+    st.session_state['prediction_context'] = build_prediction_context(df)
+
+
+def switch_to_order_prediction():
+    """Mode button callback: show order prediction and drop NL-to-SQL results"""
+    st.session_state['app_mode'] = 'order_prediction'
+    # Clear any NL-to-SQL specific session state
+    if 'nl_query_results' in st.session_state:
+        del st.session_state['nl_query_results']
+
+
+def switch_to_nl_to_sql():
+    """Mode button callback: show NL to SQL and drop the loaded order data"""
+    st.session_state['app_mode'] = 'nl_to_sql'
+    # Clear any prediction specific session state
+    if 'data' in st.session_state:
+        del st.session_state['data']
+    for key in DERIVED_DATA_KEYS:
+        if key in st.session_state:
+            del st.session_state[key]
+    if 'selected_record' in st.session_state:
+        del st.session_state['selected_record']
+    if 'selected_record_idx' in st.session_state:
+        del st.session_state['selected_record_idx']
+    if 'prediction' in st.session_state:
+        del st.session_state['prediction']
+
+
+def go_to_previous_page():
+    """Pagination callback: move the order table back one page"""
+    st.session_state['current_page'] -= 1
+
+
+def go_to_next_page():
+    """Pagination callback: move the order table forward one page"""
+    st.session_state['current_page'] += 1
+
+
+def select_action_order():
+    """Selectbox callback: store the chosen recent order as the selected record"""
+    selected_order_num = st.session_state['action_order_select']
+    if selected_order_num == "Select...":
+        # Decided not to auto-clear for now, user can trigger prediction explicitly
+        return
+
+    # Find the original index in the main df corresponding to the selected number
+    # on_change only fires when the choice changes, so the record is always refreshed here
+    selected_idx = st.session_state['recent_order_index'][selected_order_num]
+    st.session_state['selected_record'] = st.session_state['data'].loc[selected_idx]
+    st.session_state['selected_record_idx'] = selected_idx  # Store index too
 
 
 def main():
@@ -493,44 +330,34 @@ def main():
         # App mode selection buttons
         st.markdown("<h3>App Mode</h3>", unsafe_allow_html=True)
         col1, col2 = st.columns(2)
+        # The callbacks switch mode before the rerun, so the buttons are highlighted correctly
         with col1:
-            if st.button("Order Prediction",
-                         type="primary" if st.session_state['app_mode'] == 'order_prediction' else "secondary",
-                         use_container_width=True):
-                st.session_state['app_mode'] = 'order_prediction'
-                # Clear any NL-to-SQL specific session state
-                if 'nl_query_results' in st.session_state:
-                    del st.session_state['nl_query_results']
-                st.experimental_rerun()
+            st.button("Order Prediction",
+                      type="primary" if st.session_state['app_mode'] == 'order_prediction' else "secondary",
+                      use_container_width=True,
+                      on_click=switch_to_order_prediction)
 
         with col2:
-            if st.button("NL to SQL",
-                         type="primary" if st.session_state['app_mode'] == 'nl_to_sql' else "secondary",
-                         use_container_width=True):
-                st.session_state['app_mode'] = 'nl_to_sql'
-                # Clear any prediction specific session state
-                if 'data' in st.session_state:
-                    del st.session_state['data']
-                if 'selected_record' in st.session_state:
-                    del st.session_state['selected_record']
-                if 'prediction' in st.session_state:
-                    del st.session_state['prediction']
-                st.experimental_rerun()
+            st.button("NL to SQL",
+                      type="primary" if st.session_state['app_mode'] == 'nl_to_sql' else "secondary",
+                      use_container_width=True,
+                      on_click=switch_to_nl_to_sql)
 
         # Server selection
         st.markdown("<h3>Server</h3>", unsafe_allow_html=True)
 
         # Load company configuration
-        companies = load_company_config()
+        companies_by_name, config_error = load_company_config()
+        if config_error:
+            st.error(config_error)
 
-        if not companies:
+        if not companies_by_name:
             st.error("No server configurations found. Please check the dataaccessconfig.xml file.")
             st.info("You can create a dataaccessconfig.xml file based on the dataaccessconfig.xml.example template.")
             return
 
         # Server selection dropdown
-        company_names = [company['name'] for company in companies]
-        company_names.sort()  # Sort company names alphabetically
+        company_names = list(companies_by_name)  # Already sorted alphabetically
         selected_company_name = st.selectbox(
             "",
             options=company_names,
@@ -538,12 +365,16 @@ def main():
         )
 
         # Get selected company details
-        selected_company = next((c for c in companies if c['name'] == selected_company_name), None)
+        selected_company = companies_by_name.get(selected_company_name)
 
         if selected_company:
             # Database selection
             st.markdown("<h3>Database</h3>", unsafe_allow_html=True)
-            databases = get_databases(selected_company)
+            try:
+                databases = get_databases(selected_company['server'])
+            except Exception as e:
+                st.error(f"Error fetching databases from {selected_company['server']}: {str(e)}")
+                databases = []
 
             if databases:
                 selected_database = st.selectbox(
@@ -568,22 +399,26 @@ def main():
                                         del os.environ['SQL_PASSWORD']
 
                                     # Load data - pass only server and database
-                                    df = load_data(
+                                    df = load_order_data(
                                         selected_company['server'],
                                         selected_database
                                     )
 
-                                    if df is not None and not df.empty:
-                                        # Store the dataframe in session state
-                                        st.session_state['data'] = df
-                                        st.success(f"Successfully loaded {len(df)} records!")
-                                    else:
-                                        st.error("No data available. Check the logs for details.")
+                                    # Store the dataframe in session state
+                                    store_loaded_data(df)
+                                    st.success(f"Successfully loaded {len(df)} records!")
                             except Exception as e:
                                 logger.error(f"Error loading data: {e}")
                                 st.error(f"Error loading data: {str(e)}")
                     elif st.session_state['app_mode'] == 'nl_to_sql':
-                        if st.button("Connect to Database", type="primary"):
+                        connect_clicked = st.button("Connect to Database", type="primary")
+                        # Schemas are cached for an hour; refreshing drops the cache and refetches
+                        refresh_clicked = (st.session_state.get('db_connected')
+                                           and st.button("Refresh Schema"))
+                        if refresh_clicked:
+                            load_schema_context.clear()
+                            clear_schema_cache()
+                        if connect_clicked or refresh_clicked:
                             try:
                                 with st.spinner("Fetching database schema..."):
                                     # Set environment variables for the selected company
@@ -596,22 +431,19 @@ def main():
                                         del os.environ['SQL_PASSWORD']
 
                                     # Fetch schema information for the selected database - pass only server and database
-                                    schema_context = prepare_schema_context(
+                                    schema_context = load_schema_context(
                                         selected_company['server'],
                                         selected_database
                                     )
 
-                                    if schema_context and not schema_context.startswith("Error"):
-                                        # Store the schema context in session state
-                                        st.session_state['schema_context'] = schema_context
-                                        st.session_state['db_connected'] = True
-                                        st.session_state['db_credentials'] = {
-                                            'server': selected_company['server'],
-                                            'database': selected_database
-                                        }
-                                        st.success(f"Successfully connected to {selected_database}!")
-                                    else:
-                                        st.error("Could not fetch database schema. Check the logs for details.")
+                                    # Store the schema context in session state
+                                    st.session_state['schema_context'] = schema_context
+                                    st.session_state['db_connected'] = True
+                                    st.session_state['db_credentials'] = {
+                                        'server': selected_company['server'],
+                                        'database': selected_database
+                                    }
+                                    st.success(f"Successfully connected to {selected_database}!")
                             except Exception as e:
                                 logger.error(f"Error connecting to database: {e}")
                                 st.error(f"Error connecting to database: {str(e)}")
@@ -622,7 +454,10 @@ def main():
     if st.session_state['app_mode'] == 'order_prediction':
         # Main content area - search box
         st.markdown("<div class='search-container'>", unsafe_allow_html=True)
-        search_term = st.text_input("", placeholder="Search orders", label_visibility="collapsed")
+        # Inside a form the search only reruns the script on Enter/submit, not on every keystroke
+        with st.form("search_form", border=False):
+            search_term = st.text_input("", placeholder="Search orders", label_visibility="collapsed")
+            st.form_submit_button("Search")
         st.markdown("</div>", unsafe_allow_html=True)
 
         # Main content area - record selection and prediction
@@ -635,15 +470,21 @@ def main():
 
             # Filter data based on search term
             if search_term:
-                # Search across all string columns
-                mask = pd.Series(False, index=df.index)
-                searchable_columns = df.columns  # Search across all columns
-                for col in searchable_columns:
-                    if col in df.columns:
-                        mask = mask | df[col].astype(str).str.contains(search_term, case=False, na=False)
-                filtered_df = df[mask]
+                # Search across all columns with one literal scan of the precomputed row strings;
+                # the matches are kept so page changes with the same term skip the scan
+                search_result = st.session_state.get('search_result')
+                if search_result is None or search_result[0] != search_term:
+                    mask = pc.match_substring(st.session_state['search_blob'], search_term.lower())
+                    # indices_nonzero reads the bit-packed mask directly, with no NumPy bool copy
+                    search_result = (search_term, pc.indices_nonzero(mask).to_numpy())
+                    st.session_state['search_result'] = search_result
+                filtered_positions = search_result[1]
+                filtered_count = len(filtered_positions)
             else:
-                filtered_df = df
+                filtered_positions = None
+                filtered_count = len(df)
+
+            arrow_data = st.session_state['arrow_data']
 
             # Wrap main table in an expander, hidden by default
             with st.expander("View All Order Data", expanded=False):
@@ -651,45 +492,46 @@ def main():
                 st.markdown("<div class='table-container' style='overflow-x: auto; max-height: 500px;'>",
                             unsafe_allow_html=True)
 
-                # Get all columns from data for display
-                display_columns = df.columns.tolist()
-
                 # Reintroduce pagination
                 page_size = 10
-                total_pages = len(filtered_df) // page_size + (1 if len(filtered_df) % page_size > 0 else 0)
+                total_pages, remainder = divmod(filtered_count, page_size)
+                total_pages += bool(remainder)
 
                 if 'current_page' not in st.session_state:
                     st.session_state['current_page'] = 0
 
                 # Calculate start and end indices
                 start_idx = st.session_state['current_page'] * page_size
-                end_idx = min(start_idx + page_size, len(filtered_df))
-
-                # Get the current page of data
-                page_df = filtered_df.iloc[start_idx:end_idx].copy()
+                end_idx = min(start_idx + page_size, filtered_count)
 
-                # Add a "Select" column to indicate clickable row
-                page_df = page_df.reset_index(drop=True)
+                # Get the current page of data straight from the Arrow table
+                if filtered_positions is None:
+                    page_table = arrow_data.slice(start_idx, max(end_idx - start_idx, 0))
+                else:
+                    page_table = arrow_data.take(filtered_positions[start_idx:end_idx])
 
                 # Create a clean table for display
                 st.markdown("<h3>Order Data</h3>", unsafe_allow_html=True)
 
                 # Display the table using Streamlit's native dataframe display
-                st.dataframe(page_df, use_container_width=True, hide_index=True)
+                st.dataframe(
+                    page_table,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config=ORDER_TABLE_COLUMN_CONFIG,
+                    height=table_height(page_size)
+                )
 
                 # Pagination controls below the table
                 if total_pages > 1:
                     col1, col2, col3 = st.columns([1, 3, 1])
                     with col1:
                         if st.session_state['current_page'] > 0:
-                            if st.button("← Previous"):
-                                st.session_state['current_page'] -= 1
-                                st.experimental_rerun()
+                            # Callbacks update the page before the rerun, so no explicit rerun is needed
+                            st.button("← Previous", on_click=go_to_previous_page)
                     with col3:
                         if st.session_state['current_page'] < total_pages - 1:
-                            if st.button("Next →"):
-                                st.session_state['current_page'] += 1
-                                st.experimental_rerun()
+                            st.button("Next →", on_click=go_to_next_page)
                     with col2:
                         st.write(f"Page {st.session_state['current_page'] + 1} of {total_pages}")
 
@@ -699,28 +541,18 @@ def main():
             # Create Actions section below expander
             st.markdown("<h4>Recent Orders for Action</h4>", unsafe_allow_html=True)
 
-            # Get the 10 most recent records from the full dataset
-            recent_records = df.tail(10).copy() if not df.empty else pd.DataFrame()
+            # The 10 most recent records and their action columns were prepared at load time
+            recent_records = st.session_state['recent_records']
 
-            # Prepare a simplified view for the action table
             if not recent_records.empty:
-                # Identify trend columns dynamically
-                trend_columns = [col for col in df.columns if 'TREND' in col]
-
-                # Select columns to display in the dataframe
-                display_cols = ['ORDERNUMBER', 'INGRD_GRP_NM', 'ORDERSTRENGTH', 'CUMULSTRENGTH'] + trend_columns
-                action_df = recent_records[display_cols].copy()
-
-                # Rename columns for better display if needed (optional)
-                action_df.columns = ['Order #', 'Ingredient Group', 'Order Str', 'Cumul. Str'] + trend_columns
-
                 # Display the recent records using st.dataframe for a clean look
                 st.dataframe(
-                    action_df,
+                    recent_records,
                     use_container_width=True,
                     hide_index=True,
-                    # Optional: configure column widths/types if needed
-                    # column_config={ ... }
+                    column_order=st.session_state['action_columns'],
+                    column_config=ACTION_TABLE_COLUMN_CONFIG,
+                    height=table_height(len(recent_records))
                 )
 
                 # --- Selection Dropdown Below Dataframe ---
@@ -732,32 +564,15 @@ def main():
                 # Add a placeholder option
                 options = ["Select..."] + order_numbers
 
-                # Create the selectbox
-                selected_order_num = st.selectbox(
+                # Create the selectbox; the selection is stored by its on_change callback
+                st.selectbox(
                     "Select Order Number",
                     options=options,
                     key="action_order_select",
+                    on_change=select_action_order,
                     label_visibility="collapsed"  # Hide label as we have markdown above
                 )
 
-                # If a valid order number is selected, find the record and update state
-                if selected_order_num != "Select...":
-                    # Find the original index in the main df corresponding to the selected number
-                    # Note: Assumes ORDERNUMBER is unique within the recent_records
-                    selected_idx = recent_records[recent_records['ORDERNUMBER'] == selected_order_num].index[0]
-                    # Check if selection actually changed to avoid unnecessary reruns
-                    current_selection_idx = st.session_state.get('selected_record_idx', None)
-                    if selected_idx != current_selection_idx:
-                        st.session_state['selected_record'] = df.loc[selected_idx]
-                        st.session_state['selected_record_idx'] = selected_idx  # Store index too
-                        st.experimental_rerun()
-                # If 'Select...' is chosen and a record was previously selected, clear it (optional)
-                elif st.session_state.get('selected_record') is not None:
-                    if st.session_state.get('selected_record_idx') in recent_records.index:
-                        # Only clear if the previously selected record was from this action list
-                        # This prevents clearing if a selection was made elsewhere (e.g. via search)
-                        pass  # Decided not to auto-clear for now, user can trigger prediction explicitly
-
             # Generate prediction if a record is selected
             if st.session_state.get('selected_record') is not None:
                 selected_record = st.session_state['selected_record']
@@ -771,9 +586,11 @@ def main():
                 if st.button("Generate AI Comment Prediction", type="primary"):
                     with st.spinner("Generating prediction..."):
                         # Generate prediction for the selected record
-                        prediction = generate_prediction_for_record(selected_record, df)
+                        prediction = generate_prediction_for_record(
+                            selected_record, df, st.session_state['prediction_context']
+                        )
+                        # The prediction section below renders it in this same run
                         st.session_state['prediction'] = prediction
-                        st.experimental_rerun()
 
             # Add the prediction section if we have a prediction
             if 'prediction' in st.session_state:
@@ -838,7 +655,11 @@ def main():
                 # Display message to user
                 if result['success']:
                     if len(result['results']) > 0:
-                        st.success(result['message'])
+                        # A result cut off at the row cap is flagged rather than reported as complete
+                        if result.get('truncated'):
+                            st.warning(result['message'])
+                        else:
+                            st.success(result['message'])
 
                         # Display SQL query in collapsed expander
                         if 'sql_query' in result:
@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+import pyodbc
+
+logger = logging.getLogger("DBConnection")
+
+# Keep ODBC driver manager pooling on; it must be set before the first connect
+pyodbc.pooling = True
+
+# Idle connections kept per (server, database, username, password hash) for reuse
+POOL_SIZE = 5
+_connection_pool = {}
+_pool_lock = threading.Lock()
+
+
+def get_db_connection(server, database, username=None, password=None):
+    """Create and return a database connection using Windows authentication"""
+    try:
+        # Use Windows authentication if username is None
+        if username is None:
+            conn_str = (
+                f'DRIVER={{SQL Server}};'
+                f'SERVER={server};'
+                f'DATABASE={database};'
+                f'Trusted_Connection=yes'
+            )
+        else:
+            # Fallback to SQL authentication if username is provided
+            conn_str = (
+                f'DRIVER={{SQL Server}};'
+                f'SERVER={server};'
+                f'DATABASE={database};'
+                f'UID={username};'
+                f'PWD={password}'
+            )
+        return pyodbc.connect(conn_str)
+    except Exception as e:
+        logger.error(f"Error connecting to database: {e}")
+        return None
+
+
+@contextmanager
+def pooled_connection(server, database, username=None, password=None):
+    """Yield a pooled database connection and return it to the pool afterwards"""
+    # Key on the password too, so a wrong one never gets a connection opened with the right one
+    password_hash = hashlib.sha256((password or '').encode()).hexdigest()
+    key = (server, database, username, password_hash)
+    with _pool_lock:
+        idle = _connection_pool.get(key)
+        conn = idle.pop() if idle else None
+
+    # An idle connection may have been dropped by the server; replace it if so
+    if conn is not None:
+        try:
+            conn.cursor().execute("SELECT 1").fetchone()
+        except pyodbc.Error:
+            logger.info(f"Discarding stale pooled connection to {database} on {server}")
+            conn.close()
+            conn = None
+
+    if conn is None:
+        conn = get_db_connection(server, database, username, password)
+        if conn is None:
+            yield None
+            return
+
+    try:
+        yield conn
+        # Nothing run here is committed, as before with close(); end the implicit transaction
+        conn.rollback()
+    except Exception:
+        # The connection may be in a bad state, so don't hand it out again
+        conn.close()
+        raise
+
+    with _pool_lock:
+        idle = _connection_pool.setdefault(key, [])
+        if len(idle) < POOL_SIZE:
+            idle.append(conn)
+            conn = None
+    if conn is not None:
+        conn.close()
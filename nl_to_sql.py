@@ -1,11 +1,14 @@
+import hashlib
 import os
 import pandas as pd
 import google.generativeai as genai
-import pyodbc
 import logging
 import json
 import re
+import threading
 import time
+from collections import OrderedDict
+from db_connection import get_db_connection, pooled_connection
 
 # Configure logging
 logging.basicConfig(
@@ -18,59 +21,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger("NLtoSQL")
 
-
-def get_db_connection(server, database, username=None, password=None):
-    """Create and return a database connection using Windows authentication"""
-    try:
-        # Use Windows authentication if username is None
-        if username is None:
-            conn_str = (
-                f'DRIVER={{SQL Server}};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'Trusted_Connection=yes'
-            )
-        else:
-            # Fallback to SQL authentication if username is provided
-            conn_str = (
-                f'DRIVER={{SQL Server}};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password}'
-            )
-        return pyodbc.connect(conn_str)
-    except Exception as e:
-        logger.error(f"Error connecting to database: {e}")
-        return None
-
-
-def get_table_schema(server, database, username=None, password=None):
-    """Retrieve schema information for the database - optimized version"""
+# Rows the driver is asked for per fetch when reading query results
+FETCH_BATCH_SIZE = 500
+
+# Most rows a generated query may return, in case the model leaves out TOP
+MAX_RESULT_ROWS = 5000
+
+# Schema metadata and its rendered context kept per (server, database, username)
+# for SCHEMA_CACHE_TTL seconds
+SCHEMA_CACHE_TTL = 900
+_schema_cache = {}
+
+# Gemini models kept per API key, so the SDK is configured and the model built once
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+_gemini_models = {}
+_gemini_lock = threading.Lock()
+
+# Generated SQL kept per (normalized question, schema context digest), least recently used evicted first
+SQL_CACHE_SIZE = 256
+_sql_cache = OrderedDict()
+_sql_cache_lock = threading.Lock()
+_WHITESPACE_RE = re.compile(r'\s+')
+# Stands in for the SQL when Gemini returns an empty query; never cached
+EMPTY_SQL_PLACEHOLDER = "-- Could not generate a valid SQL query"
+
+# SQL pulled out of Gemini responses that aren't valid JSON, compiled once
+_SQL_EXTRACT_RE = re.compile(r'(?:```sql)?\s*(SELECT[\s\S]+?)(?:```|$)', re.IGNORECASE)
+
+# Most tables matched by question words before their FK neighbours are added
+RELEVANT_TABLE_LIMIT = 10
+_QUERY_WORD_RE = re.compile(r'[a-z0-9]+')
+# Common question words that would match unrelated table and column names
+_QUERY_STOP_WORDS = {
+    'all', 'and', 'are', 'can', 'count', 'each', 'for', 'from', 'get', 'give', 'how', 'list',
+    'many', 'much', 'per', 'show', 'than', 'that', 'the', 'their', 'there', 'this', 'top',
+    'what', 'when', 'where', 'which', 'who', 'with'
+}
+
+
+def get_schema_metadata(server, database, username=None, password=None):
+    """Retrieve table columns and foreign key relationships for the database in one round trip"""
     try:
         start_time = time.time()
         logger.info(f"Fetching schema information for {database} on {server}")
-        
-        conn = get_db_connection(server, database, username, password)
-        if conn is None:
-            return None
-
-        cursor = conn.cursor()
-        schema_data = {}
 
         # Optimized query to get table and column information in one go
         # Uses system catalog views for better performance
-        query = """
+        columns_query = """
         SELECT 
             s.name AS schema_name,
             t.name AS table_name,
             c.name AS column_name,
             ty.name AS data_type,
             c.max_length,
-            c.is_nullable,
-            (SELECT COUNT(*) FROM sys.foreign_keys fk 
-             INNER JOIN sys.foreign_key_columns fkc ON fk.object_id = fkc.constraint_object_id
-             WHERE fkc.parent_object_id = t.object_id) as has_relationships
+            c.is_nullable
         FROM 
             sys.tables t
             INNER JOIN sys.columns c ON t.object_id = c.object_id
@@ -78,63 +82,17 @@ def get_table_schema(server, database, username=None, password=None):
             INNER JOIN sys.schemas s ON t.schema_id = s.schema_id
         WHERE
             t.is_ms_shipped = 0  -- Exclude system tables
+            AND s.name NOT IN ('sys', 'INFORMATION_SCHEMA')
+            AND t.name NOT LIKE '#%'  -- Exclude temp tables
+            AND LOWER(c.name) NOT LIKE '%sold[_]to%'  -- Exclude sold_to columns
         ORDER BY 
-            has_relationships DESC, -- Tables with relationships first
             t.name, c.column_id
         """
 
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        # Process the rows
-        for row in rows:
-            schema_name, table_name, column_name, data_type, max_length, is_nullable, _ = row
-            
-            # Skip system tables and temp tables
-            if schema_name in ('sys', 'INFORMATION_SCHEMA') or table_name.startswith('#'):
-                continue
-
-            # Skip columns with 'sold_to' in their name
-            if 'sold_to' in column_name.lower():
-                continue
-
-            full_table_name = f"{schema_name}.{table_name}"
-            if full_table_name not in schema_data:
-                schema_data[full_table_name] = []
-
-            schema_data[full_table_name].append({
-                "column_name": column_name,
-                "data_type": data_type,
-                "max_length": max_length,
-                "is_nullable": bool(is_nullable)
-            })
-
-        conn.close()
-        
-        elapsed_time = time.time() - start_time
-        logger.info(f"Schema information fetched in {elapsed_time:.2f} seconds")
-        return schema_data
-    except Exception as e:
-        logger.error(f"Error getting schema information: {e}")
-        return None
-
-
-def get_foreign_keys(server, database, username=None, password=None):
-    """Retrieve foreign key relationships for the database - optimized version"""
-    try:
-        start_time = time.time()
-        logger.info(f"Fetching foreign key relationships for {database} on {server}")
-        
-        conn = get_db_connection(server, database, username, password)
-        if conn is None:
-            return None
-
-        cursor = conn.cursor()
-        fk_relationships = []
-
         # Optimized query with additional filters
-        query = """
-        SELECT 
+        # Only the first 300 relationships are used, so the rest are never sent
+        foreign_keys_query = """
+        SELECT TOP 300
             fk.name AS fk_name,
             ps.name AS parent_schema,
             tp.name AS parent_table,
@@ -153,53 +111,98 @@ def get_foreign_keys(server, database, username=None, password=None):
             INNER JOIN sys.schemas rs ON tr.schema_id = rs.schema_id
         WHERE
             tp.is_ms_shipped = 0 AND  -- Exclude system tables
-            tr.is_ms_shipped = 0      -- Exclude system tables
+            tr.is_ms_shipped = 0 AND  -- Exclude system tables
+            LOWER(cp.name) NOT LIKE '%sold[_]to%' AND  -- Exclude relationships on sold_to columns
+            LOWER(cr.name) NOT LIKE '%sold[_]to%'
         ORDER BY 
             tp.name, tr.name
         """
 
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        # Process the first 300 relationships to avoid excessive data
-        for row in rows[:300]:
-            fk_name, parent_schema, parent_table, parent_column, ref_schema, ref_table, ref_column = row
+        # Foreign key columns per referencing table, counted once per table rather than
+        # per column row, with the same filters as the relationships above
+        related_tables_query = """
+        SELECT
+            ps.name AS schema_name,
+            tp.name AS table_name,
+            COUNT(*) AS fk_count
+        FROM 
+            sys.foreign_key_columns fkc
+            INNER JOIN sys.tables tp ON fkc.parent_object_id = tp.object_id
+            INNER JOIN sys.tables tr ON fkc.referenced_object_id = tr.object_id
+            INNER JOIN sys.columns cp ON fkc.parent_column_id = cp.column_id AND fkc.parent_object_id = cp.object_id
+            INNER JOIN sys.columns cr ON fkc.referenced_column_id = cr.column_id AND fkc.referenced_object_id = cr.object_id
+            INNER JOIN sys.schemas ps ON tp.schema_id = ps.schema_id
+        WHERE
+            tp.is_ms_shipped = 0 AND
+            tr.is_ms_shipped = 0 AND
+            LOWER(cp.name) NOT LIKE '%sold[_]to%' AND
+            LOWER(cr.name) NOT LIKE '%sold[_]to%'
+        GROUP BY
+            fkc.parent_object_id, ps.name, tp.name
+        """
 
-            # Skip relationships involving sold_to columns
-            if 'sold_to' in parent_column.lower() or 'sold_to' in ref_column.lower():
-                continue
+        schema_data = {}
+        fk_relationships = []
 
-            fk_relationships.append({
-                "fk_name": fk_name,
-                "parent_table": f"{parent_schema}.{parent_table}",
-                "parent_column": parent_column,
-                "referenced_table": f"{ref_schema}.{ref_table}",
-                "referenced_column": ref_column
-            })
+        # Send the queries as one batch and stream each result set in turn,
+        # so rows are processed as they arrive instead of being collected first
+        with pooled_connection(server, database, username, password) as conn:
+            if conn is None:
+                return None
+            cursor = conn.cursor()
+            cursor.execute(f"{columns_query};\n{foreign_keys_query};\n{related_tables_query}")
+
+            # Process the rows; system, temp and sold_to rows are already filtered out in SQL
+            for row in cursor:
+                schema_name, table_name, column_name, data_type, max_length, is_nullable = row
+
+                full_table_name = f"{schema_name}.{table_name}"
+                if full_table_name not in schema_data:
+                    schema_data[full_table_name] = []
+
+                schema_data[full_table_name].append({
+                    "column_name": column_name,
+                    "data_type": data_type,
+                    "max_length": max_length,
+                    "is_nullable": bool(is_nullable)
+                })
+
+            # Process the first 300 relationships (limited in the query) to avoid excessive data
+            cursor.nextset()
+            for row in cursor:
+                fk_name, parent_schema, parent_table, parent_column, ref_schema, ref_table, ref_column = row
+
+                fk_relationships.append({
+                    "fk_name": fk_name,
+                    "parent_table": f"{parent_schema}.{parent_table}",
+                    "parent_column": parent_column,
+                    "referenced_table": f"{ref_schema}.{ref_table}",
+                    "referenced_column": ref_column
+                })
+
+            cursor.nextset()
+            fk_counts = {f"{schema_name}.{table_name}": fk_count for schema_name, table_name, fk_count in cursor}
+            cursor.close()
 
-        conn.close()
-        
         elapsed_time = time.time() - start_time
-        logger.info(f"Foreign key relationships fetched in {elapsed_time:.2f} seconds")
-        return fk_relationships
+        logger.info(f"Schema information and foreign keys fetched in {elapsed_time:.2f} seconds")
+        # Tables with the most foreign key columns first; the stable sort keeps name order on ties
+        schema_data = dict(sorted(schema_data.items(), key=lambda x: -fk_counts.get(x[0], 0)))
+        return schema_data, fk_relationships
     except Exception as e:
-        logger.error(f"Error getting foreign key relationships: {e}")
+        logger.error(f"Error getting schema information: {e}")
         return None
 
 
-def prepare_schema_context(server, database, username=None, password=None):
-    """Prepare a context string that describes the database schema for the AI - optimized version"""
-    start_time = time.time()
-    schema_data = get_table_schema(server, database, username, password)
-    
-    if schema_data is None:
-        return "Error: Could not retrieve schema information."
+def clear_schema_cache():
+    """Drop all cached schema contexts so the next lookup hits the database"""
+    _schema_cache.clear()
 
-    # Only get foreign keys if we have schema data
-    fk_relationships = get_foreign_keys(server, database, username, password)
 
-    context = f"Database: {database}\n\n"
-    context += "Tables and Columns:\n"
+def render_schema_context(database, schema_data, fk_relationships):
+    """Describe the given tables, columns and relationships as prompt text"""
+    # Collect the lines in a list and join once rather than growing a string with +=
+    parts = [f"Database: {database}\n\n", "Tables and Columns:\n"]
 
     # Limit the number of tables to include in the context (focus on tables with most columns or relationships)
     # Sort tables by number of columns to prioritize more complex tables
@@ -207,34 +210,141 @@ def prepare_schema_context(server, database, username=None, password=None):
     top_tables = sorted_tables[:50]  # Limit to top 50 tables
     
     for table_name, columns in top_tables:
-        context += f"Table: {table_name}\n"
+        parts.append(f"Table: {table_name}\n")
         # Limit columns per table to avoid excessive context
-        for column in columns[:20]:  # Limit to top 20 columns per table
-            nullable_str = "NULL" if column["is_nullable"] else "NOT NULL"
-            context += f"  - {column['column_name']} ({column['data_type']}, {nullable_str})\n"
+        parts.extend(
+            f"  - {column['column_name']} ({column['data_type']}, {'NULL' if column['is_nullable'] else 'NOT NULL'})\n"
+            for column in columns[:20]  # Limit to top 20 columns per table
+        )
         if len(columns) > 20:
-            context += f"  - ... and {len(columns) - 20} more columns\n"
-        context += "\n"
+            parts.append(f"  - ... and {len(columns) - 20} more columns\n")
+        parts.append("\n")
 
     if fk_relationships:
-        context += "Foreign Key Relationships:\n"
+        parts.append("Foreign Key Relationships:\n")
         # Limit the number of relationships to include
-        for fk in fk_relationships[:100]:  # Limit to 100 relationships
-            context += f"  - {fk['parent_table']}.{fk['parent_column']} -> {fk['referenced_table']}.{fk['referenced_column']}\n"
+        parts.extend(
+            f"  - {fk['parent_table']}.{fk['parent_column']} -> {fk['referenced_table']}.{fk['referenced_column']}\n"
+            for fk in fk_relationships[:100]  # Limit to 100 relationships
+        )
         if len(fk_relationships) > 100:
-            context += f"  - ... and {len(fk_relationships) - 100} more relationships\n"
+            parts.append(f"  - ... and {len(fk_relationships) - 100} more relationships\n")
+
+    return "".join(parts)
+
+
+def select_relevant_schema(schema_data, fk_relationships, natural_language_query, limit=RELEVANT_TABLE_LIMIT):
+    """Narrow the schema to the tables whose names match words in the question, or None if none do"""
+    words = {word for word in _QUERY_WORD_RE.findall(natural_language_query.lower())
+             if len(word) > 2 and word not in _QUERY_STOP_WORDS}
+    if not words:
+        return None
+
+    # Table name hits count double; column name hits show which tables hold the data asked for
+    scores = {}
+    for table_name, columns in schema_data.items():
+        table_text = table_name.lower()
+        column_text = " ".join(column["column_name"].lower() for column in columns)
+        score = sum(2 for word in words if word in table_text) + sum(1 for word in words if word in column_text)
+        if score:
+            scores[table_name] = score
+    if not scores:
+        return None
+
+    # Stable sort keeps the catalog ranking for ties
+    matched = set(sorted(scores, key=scores.get, reverse=True)[:limit])
+
+    # Keep the tables the matches join to, so the model can still write the JOINs
+    selected = set(matched)
+    for fk in fk_relationships:
+        if fk["parent_table"] in matched:
+            selected.add(fk["referenced_table"])
+        elif fk["referenced_table"] in matched:
+            selected.add(fk["parent_table"])
+
+    relevant_tables = {table_name: columns for table_name, columns in schema_data.items() if table_name in selected}
+    relevant_fks = [fk for fk in fk_relationships
+                    if fk["parent_table"] in selected and fk["referenced_table"] in selected]
+    return relevant_tables, relevant_fks
+
+
+def prepare_schema_context(server, database, username=None, password=None, use_cache=True,
+                           natural_language_query=None):
+    """Prepare a context string that describes the database schema for the AI - optimized version"""
+    start_time = time.time()
+
+    # Schemas rarely change, so serve recent metadata for the same database from the cache;
+    # as with the key, a cached entry is only returned for the same password
+    cache_key = (server, database, username)
+    password_hash = hashlib.sha256((password or '').encode()).hexdigest()
+    cached = _schema_cache.get(cache_key)
+    if use_cache and cached is not None and cached[1] == password_hash \
+            and start_time - cached[0] < SCHEMA_CACHE_TTL:
+        logger.info(f"Using cached schema context for {database} on {server}")
+        _, _, metadata, context = cached
+    else:
+        metadata = get_schema_metadata(server, database, username, password)
+
+        if metadata is None:
+            return "Error: Could not retrieve schema information."
+
+        context = render_schema_context(database, *metadata)
+        _schema_cache[cache_key] = (time.time(), password_hash, metadata, context)
+
+    # With a question, only describe the tables it appears to be about; the full
+    # context is the fallback when nothing in the schema matches its words
+    if natural_language_query:
+        relevant = select_relevant_schema(*metadata, natural_language_query)
+        if relevant is not None:
+            context = render_schema_context(database, *relevant)
 
     elapsed_time = time.time() - start_time
     logger.info(f"Schema context prepared in {elapsed_time:.2f} seconds")
     return context
 
 
+def get_gemini_model(api_key):
+    """Return the Gemini model for an API key, configuring the SDK on first use"""
+    with _gemini_lock:
+        model = _gemini_models.get(api_key)
+        if model is None:
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+            _gemini_models[api_key] = model
+    return model
+
+
 def nl_to_sql(natural_language_query, schema_context, api_key):
     """Convert natural language query to SQL using Gemini AI"""
+    # Repeated questions against the same schema reuse the earlier answer instead of calling Gemini
+    cache_key = (
+        _WHITESPACE_RE.sub(' ', natural_language_query.strip().lower()),
+        hashlib.blake2b(schema_context.encode(), digest_size=8).hexdigest()
+    )
+    with _sql_cache_lock:
+        cached = _sql_cache.get(cache_key)
+        if cached is not None:
+            _sql_cache.move_to_end(cache_key)
+    if cached is not None:
+        logger.info(f"Using cached SQL for query: {natural_language_query}")
+        return dict(cached)
+
+    result = _generate_sql(natural_language_query, schema_context, api_key)
+
+    # Only keep answers that produced SQL; failures should be retried
+    if result.get("sql_query") and result["sql_query"] != EMPTY_SQL_PLACEHOLDER:
+        with _sql_cache_lock:
+            _sql_cache[cache_key] = dict(result)
+            if len(_sql_cache) > SQL_CACHE_SIZE:
+                _sql_cache.popitem(last=False)
+    return result
+
+
+def _generate_sql(natural_language_query, schema_context, api_key):
+    """Ask Gemini for the SQL and explanation answering a natural language query"""
     try:
         # Configure Gemini API
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_gemini_model(api_key)
 
         logger.info(f"Processing natural language query: {natural_language_query}")
 
@@ -272,9 +382,9 @@ def nl_to_sql(natural_language_query, schema_context, api_key):
         response = model.generate_content(prompt)
         logger.info("Received response from Gemini API")
 
-        # Remove markdown formatting if present
-        response_text = re.sub(r'```json\s*', '', response.text)
-        response_text = re.sub(r'```', '', response_text)
+        # Remove markdown formatting if present; the fences are literal, so plain replaces
+        # do it without the regex engine and json.loads ignores the whitespace left behind
+        response_text = response.text.replace('```json', '').replace('```', '')
 
         # Try to parse the response as JSON
         try:
@@ -284,7 +394,7 @@ def nl_to_sql(natural_language_query, schema_context, api_key):
             # Validate that the SQL query is present and non-empty
             if not result.get("sql_query"):
                 logger.warning("SQL query is empty in the response")
-                result["sql_query"] = "-- Could not generate a valid SQL query"
+                result["sql_query"] = EMPTY_SQL_PLACEHOLDER
 
             return {
                 "sql_query": result.get("sql_query", ""),
@@ -293,7 +403,7 @@ def nl_to_sql(natural_language_query, schema_context, api_key):
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse JSON response: {e}. Attempting to extract SQL with regex.")
             # If response is not valid JSON, try to extract SQL using regex
-            sql_match = re.search(r'(?:```sql)?\s*(SELECT[\s\S]+?)(?:```|$)', response_text, re.IGNORECASE)
+            sql_match = _SQL_EXTRACT_RE.search(response_text)
             if sql_match:
                 sql_query = sql_match.group(1).strip()
                 logger.info("Extracted SQL query using regex")
@@ -319,13 +429,33 @@ def nl_to_sql(natural_language_query, schema_context, api_key):
 def execute_sql_query(server, database, username=None, password=None, sql_query=None):
     """Execute the SQL query and return results as a DataFrame"""
     try:
+        # Generated SQL can change session settings, so it runs on a connection of its own
+        # that is closed afterwards rather than handed back to the shared pool
         conn = get_db_connection(server, database, username, password)
         if conn is None:
             return None
 
-        # Try to execute the query and get results
-        df = pd.read_sql(sql_query, conn)
-        conn.close()
+        try:
+            # Try to execute the query and get results, building the frame straight from
+            # the cursor rather than through pd.read_sql's DBAPI compatibility layer
+            cursor = conn.cursor()
+            cursor.arraysize = FETCH_BATCH_SIZE
+            # Cap the rows the server returns, in case the model leaves out TOP
+            cursor.execute(f"SET ROWCOUNT {MAX_RESULT_ROWS}")
+            cursor.execute(sql_query)
+            columns = [column[0] for column in cursor.description]
+            # from_records converts the pyodbc Rows itself, so no extra tuple pass here
+            rows = []
+            while True:
+                batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not batch:
+                    break
+                rows.extend(batch)
+        finally:
+            conn.close()
+
+        # coerce_float turns DECIMAL values into floats, as pd.read_sql did
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
 
         return df
     except Exception as e:
@@ -337,9 +467,20 @@ def execute_query_with_user_feedback(server, database, username=None, password=N
     """Execute the entire NL-to-SQL pipeline and handle user feedback gracefully"""
     start_time = time.time()
     logger.info(f"Starting execution for query: {natural_language_query}")
+
+    # Bail out before any database work if Gemini can't be called anyway
+    if not api_key:
+        logger.error("Missing Google API key")
+        return {
+            "success": False,
+            "results": None,
+            "message": "The AI service is not configured. Please set GOOGLE_API_KEY in your .env file.",
+            "summary": None
+        }
     
     # Get schema context
-    schema_context = prepare_schema_context(server, database, username, password)
+    schema_context = prepare_schema_context(server, database, username, password,
+                                            natural_language_query=natural_language_query)
     if "Error:" in schema_context:
         return {
             "success": False,
@@ -383,22 +524,23 @@ def execute_query_with_user_feedback(server, database, username=None, password=N
             "sql_query": sql_query  # Include the SQL query for empty results
         }
 
-    # Generate summary for the results
-    try:
-        # Create a summary based on the data type and content
-        columns = list(results.columns)
-        row_count = len(results)
-
-        # Create the final summary text
-        summary = f"Found {row_count} records with {len(columns)} columns."
+    # Generate summary for the results; the shape is already known, so nothing here can fail
+    row_count, column_count = results.shape
+    summary = f"Found {row_count} records with {column_count} columns."
+    message = f"Found {row_count} records matching your query."
 
-        # Add explanation if available
-        if sql_result.get("explanation"):
-            summary += f"\n\nThis shows: {sql_result.get('explanation')}"
+    # SET ROWCOUNT stops silently at the cap, so a full result may be missing rows
+    truncated = row_count >= MAX_RESULT_ROWS
+    if truncated:
+        note = (f"Only the first {MAX_RESULT_ROWS} rows are shown and the full result may be larger; "
+                f"add filters or a TOP clause to your question to narrow it.")
+        summary += f" {note}"
+        message = f"Showing the first {MAX_RESULT_ROWS} records matching your query. {note}"
 
-    except Exception as e:
-        logger.error(f"Error generating summary: {e}")
-        summary = f"Found {len(results)} records matching your query."
+    # Add explanation if available
+    explanation = sql_result.get("explanation")
+    if explanation:
+        summary += f"\n\nThis shows: {explanation}"
 
     elapsed_time = time.time() - start_time
     logger.info(f"Query execution completed in {elapsed_time:.2f} seconds")
@@ -407,7 +549,8 @@ def execute_query_with_user_feedback(server, database, username=None, password=N
     return {
         "success": True,
         "results": results,
-        "message": f"Found {len(results)} records matching your query.",
+        "message": message,
         "summary": summary,
+        "truncated": truncated,
         "sql_query": sql_query  # Include the SQL query in the result
     }   
\ No newline at end of file
@@ -1,14 +1,20 @@
+import hashlib
 import json
 import logging
 import os
-import re
+import threading
 import time
+from collections import OrderedDict
+from decimal import Decimal
 
 import google.generativeai as genai
+import numpy as np
+import orjson
 import pandas as pd
-import pyodbc
 from dotenv import load_dotenv
 
+from db_connection import pooled_connection
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,41 +33,52 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 genai.configure(api_key=GOOGLE_API_KEY)
 
-
-def get_db_connection(server, database, username=None, password=None):
-    """Create and return a database connection using Windows authentication"""
-    try:
-        # Use Windows authentication if username is None
-        if username is None:
-            conn_str = (
-                f'DRIVER={{SQL Server}};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'Trusted_Connection=yes'
-            )
-        else:
-            # Fallback to SQL authentication if username is provided
-            conn_str = (
-                f'DRIVER={{SQL Server}};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password}'
-            )
-        return pyodbc.connect(conn_str)
-    except Exception as e:
-        logger.error(f"Error connecting to database: {e}")
-        return None
+# One model instance shared by all predictions instead of one per call
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+_gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+# Rows pulled per fetchmany() round trip when loading order history
+FETCH_BATCH_SIZE = 500
+
+# Number of most similar historical orders sent to Gemini with each prediction
+SIMILAR_RECORDS_LIMIT = 50
+
+# Predictions kept per prompt digest, least recently used evicted first
+PREDICTION_CACHE_SIZE = 256
+_prediction_cache = OrderedDict()
+_prediction_cache_lock = threading.Lock()
+# Prompts currently being sent to Gemini; concurrent callers with the same digest wait here
+_predictions_in_flight = {}
+
+# Gemini calls made per prediction before an unparseable answer is reported as an error
+PREDICTION_ATTEMPTS = 2
+
+
+def specialize_dtypes(df, category_ratio=0.5):
+    """Convert columns to compact numeric or categorical dtypes where the values allow it"""
+    # Only columns the driver already returned as integers are downcast below
+    integer_columns = df.select_dtypes(include='integer').columns
+    for col in df.columns[df.dtypes == object]:
+        values = df[col]
+        # DECIMAL columns arrive as Decimal objects; store them as plain floats.
+        # Text is never parsed, so digit-only identifiers like '000123' keep their zeros
+        non_null = values.dropna()
+        if len(non_null) and all(isinstance(value, Decimal) for value in non_null):
+            df[col] = pd.to_numeric(values)
+        elif values.nunique() < category_ratio * len(values):
+            df[col] = values.astype('category')
+    # Integers are exact at any width, so shrink them to the smallest that fits;
+    # floats stay float64 because their values are copied into the prompt
+    for col in integer_columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
 
 
 def load_data(server, database, username=None, password=None):
     """Load and prepare data from SQL Server using the specific query"""
     start_time = time.time()
-    try:
-        conn = get_db_connection(server, database, username, password)
-        if conn is None:
-            return None
 
+    try:
         # Query to get the data
         query = """
         SELECT TOP 1000
@@ -95,8 +112,24 @@ def load_data(server, database, username=None, password=None):
 		order by 1 desc
         """
 
-        df = pd.read_sql(query, conn)
-        conn.close()
+        with pooled_connection(server, database, username, password) as conn:
+            if conn is None:
+                return None
+            # Build the frame straight from the cursor rather than via pd.read_sql
+            cursor = conn.cursor()
+            cursor.arraysize = FETCH_BATCH_SIZE
+            cursor.execute(query)
+            columns = [column[0] for column in cursor.description]
+            # from_records converts the pyodbc Rows itself, so no extra tuple pass here
+            rows = []
+            while True:
+                batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not batch:
+                    break
+                rows.extend(batch)
+            cursor.close()
+
+        df = pd.DataFrame.from_records(rows, columns=columns)
 
         # Check if we got any data
         if df.empty:
@@ -106,11 +139,11 @@ def load_data(server, database, username=None, password=None):
         # Clean and prepare the data
         # Convert trend columns to numeric, handling any non-numeric values
         trend_columns = [col for col in df.columns if 'TREND' in col]
-        for col in trend_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df[trend_columns] = df[trend_columns].apply(pd.to_numeric, errors='coerce')
+        df = specialize_dtypes(df)
 
         # Remove any rows where all trend values are NaN
-        df = df.dropna(subset=trend_columns, how='all')
+        df = df[df[trend_columns].notna().to_numpy().any(axis=1)]
 
         # Sort by the most recent trend
         if 'TREND_LAG1_STRNT' in df.columns:
@@ -124,43 +157,93 @@ def load_data(server, database, username=None, password=None):
         return None
 
 
-def prepare_prompt(selected_record, df):
-    """Prepare prompt for Gemini API using the selected record and all other records"""
+def top_k_similar(trends, query, k):
+    """Return row positions of the k trend vectors closest to query, nearest first"""
+    # Without any lag on the selected order there is nothing to compare, so keep the frame order
+    if np.isnan(query).all():
+        return np.arange(min(k, len(trends)))
+
+    # Mean squared difference over the lags present on both sides, so sparse rows are not
+    # favoured for having fewer terms; rows sharing no lag with the query rank last
+    squared = np.square(trends - query)
+    shared = ~np.isnan(squared)
+    counts = shared.sum(axis=1)
+    totals = np.where(shared, squared, 0.0).sum(axis=1)
+    distances = np.full(len(trends), np.inf)
+    np.divide(totals, counts, out=distances, where=counts > 0)
+    if k < len(distances):
+        nearest = np.argpartition(distances, k)[:k]
+    else:
+        nearest = np.arange(len(distances))
+    return nearest[np.argsort(distances[nearest], kind='stable')]
+
+
+def build_prediction_context(df):
+    """Extract the arrays prompts are built from; they depend only on the loaded data"""
+    trend_columns = [col for col in df.columns if 'TREND' in col]
+    return {
+        'trend_columns': trend_columns,
+        'trends': df[trend_columns].to_numpy(dtype=np.float64),
+        'order_numbers': df['ORDERNUMBER'].to_numpy(),
+        'comments': df['ORDER_JRNL_CMT_TXT'].to_numpy()
+    }
+
+
+def prepare_prompt(selected_record, df, context=None):
+    """Prepare prompt for Gemini API using the selected record and the most similar other records"""
     if df is None or df.empty:
         return None
 
     if selected_record is None:
         return None
 
-    # Get trend columns
-    trend_columns = [col for col in df.columns if 'TREND' in col]
+    # Reuse the arrays extracted at load time when the caller has them
+    if context is None:
+        context = build_prediction_context(df)
+    trend_columns = context['trend_columns']
 
     # Format the selected record data
-    selected_trends = {col: float(selected_record[col]) for col in trend_columns}
-
-    # Get other records (excluding the selected one) - limit to a reasonable number
-    other_records = df[df.ORDERNUMBER != selected_record.ORDERNUMBER].head(500).copy()
+    selected_vector = selected_record[trend_columns].to_numpy(dtype=np.float64)
+    selected_trends = dict(zip(trend_columns, selected_vector.tolist()))
+
+    # Get other records (excluding the selected order), keeping only the ones whose
+    # trend pattern is closest to the selected order so the prompt stays small
+    all_order_numbers = context['order_numbers']
+    candidate_positions = np.flatnonzero(all_order_numbers != selected_record.ORDERNUMBER)
+    candidate_trends = context['trends'][candidate_positions]
+    nearest = top_k_similar(candidate_trends, selected_vector, SIMILAR_RECORDS_LIMIT)
+    nearest_positions = candidate_positions[nearest]
+
+    # Use the trend block as one float matrix plus parallel order/comment lists,
+    # gathering only the columns the prompt needs rather than whole rows
+    trends = candidate_trends[nearest]
+    order_numbers = all_order_numbers[nearest_positions].tolist()
+    comments = context['comments'][nearest_positions].tolist()
 
     # Format other records as a list of dictionaries with their trends and comments
-    other_records_data = []
-    for _, record in other_records.iterrows():
-        record_data = {
-            "order_number": record.ORDERNUMBER,
-            "comment": record.ORDER_JRNL_CMT_TXT,
-            "trends": {col: float(record[col]) for col in trend_columns}
+    other_records_data = [
+        {
+            "order_number": order_number,
+            "comment": comment,
+            "trends": dict(zip(trend_columns, trend_values))
         }
-        other_records_data.append(record_data)
+        for order_number, comment, trend_values in zip(order_numbers, comments, trends.tolist())
+    ]
+
+    # Serialize the JSON blocks compactly; indentation would only add prompt tokens
+    other_records_json = orjson.dumps(other_records_data, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    selected_trends_json = orjson.dumps(selected_trends).decode()
 
     prompt = f"""
     You are provided with historical order trend data and corresponding journal comments (if available), along with a new order and its trend data.
 
     Base Order Data (some records may or may not have comments):
-    {json.dumps(other_records_data, indent=2)}
+    {other_records_json}
 
     New Order Number: {selected_record.ORDERNUMBER}
 
     New Order Trend Data:
-    {json.dumps(selected_trends, indent=2)}
+    {selected_trends_json}
 
     First, analyze the base order data to understand how trend patterns relate to journal comments when comments are available. Identify any consistent patterns or insights.
 
@@ -185,31 +268,73 @@ def get_prediction(prompt):
             "reason": "Failed to generate prompt due to missing or empty data"
         }
 
+    # The same order against the same data builds the same prompt, so reuse its answer
+    cache_key = hashlib.sha256(f"{GEMINI_MODEL_NAME}\n{prompt}".encode()).hexdigest()
+    with _prediction_cache_lock:
+        cached = _prediction_cache.get(cache_key)
+        if cached is not None:
+            _prediction_cache.move_to_end(cache_key)
+        in_flight = _predictions_in_flight.get(cache_key) if cached is None else None
+        if cached is None and in_flight is None:
+            _predictions_in_flight[cache_key] = threading.Event()
+    if cached is not None:
+        logger.info("Using cached prediction for an identical prompt")
+        return dict(cached)
+
+    # Another session is already asking Gemini this exact prompt, so share its answer
+    if in_flight is not None:
+        in_flight.wait()
+        with _prediction_cache_lock:
+            cached = _prediction_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Using prediction from a concurrent identical request")
+            return dict(cached)
+        return get_prediction(prompt)
+
+    try:
+        return _request_prediction(prompt, cache_key, start_time)
+    finally:
+        with _prediction_cache_lock:
+            _predictions_in_flight.pop(cache_key).set()
+
+
+def _request_prediction(prompt, cache_key, start_time):
+    """Send the prompt to Gemini and cache the parsed answer"""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
+        for attempt in range(1, PREDICTION_ATTEMPTS + 1):
+            response = _gemini_model.generate_content(prompt)
+
+            # Remove the markdown code fences (```json ... ```) Gemini sometimes wraps around its JSON;
+            # they are literal, so plain replaces do it and orjson ignores the whitespace left behind
+            response_text = response.text.replace('```json', '').replace('```', '')
 
-        # Remove markdown formatting
-        response_text = re.sub(r'```json\s*', '', response.text)
-        response_text = re.sub(r'```', '', response_text)
+            # Try to parse the response as JSON; a malformed answer is usually a one-off, so ask again
+            try:
+                result = orjson.loads(response_text)
+            except orjson.JSONDecodeError:
+                logger.warning(f"Failed to parse AI response as JSON (attempt {attempt}): {response_text}")
+                continue
 
-        # Try to parse the response as JSON
-        try:
-            result = json.loads(response_text)
             # Ensure only the required fields are present
             elapsed_time = time.time() - start_time
             logger.info(f"Prediction generated successfully in {elapsed_time:.2f} seconds")
-            return {
+            prediction = {
                 "predicted_comment": result.get("predicted_comment", ""),
                 "reason": result.get("reason", "")
             }
-        except json.JSONDecodeError:
-            # If response is not valid JSON, create a structured response
-            logger.error(f"Failed to parse AI response as JSON: {response_text}")
-            return {
-                "predicted_comment": "Error: Could not generate prediction",
-                "reason": "Failed to parse AI response into JSON format"
-            }
+            # Only parsed answers are kept; errors should be retried
+            with _prediction_cache_lock:
+                _prediction_cache[cache_key] = dict(prediction)
+                if len(_prediction_cache) > PREDICTION_CACHE_SIZE:
+                    _prediction_cache.popitem(last=False)
+            return prediction
+
+        # If no response was valid JSON, create a structured response
+        logger.error(f"Failed to parse AI response as JSON after {PREDICTION_ATTEMPTS} attempts")
+        return {
+            "predicted_comment": "Error: Could not generate prediction",
+            "reason": "Failed to parse AI response into JSON format"
+        }
 
     except Exception as e:
         logger.error(f"Error getting prediction: {e}")
@@ -219,7 +344,7 @@ def get_prediction(prompt):
         }
 
 
-def generate_prediction_for_record(selected_record, df):
+def generate_prediction_for_record(selected_record, df, context=None):
     """Generate AI prediction for a specific record"""
     start_time = time.time()
     logger.info(f"Starting prediction generation for order {selected_record.ORDERNUMBER}")
@@ -233,7 +358,7 @@ def generate_prediction_for_record(selected_record, df):
         }
 
     # Generate prompt with selected record and remaining records
-    prompt = prepare_prompt(selected_record, df)
+    prompt = prepare_prompt(selected_record, df, context)
     prediction = get_prediction(prompt)
 
     elapsed_time = time.time() - start_time
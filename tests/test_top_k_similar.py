@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+
+from order_prediction_sql import top_k_similar
+
+
+class TopKSimilarTest(unittest.TestCase):
+    def test_sparse_row_does_not_outrank_dense_close_row(self):
+        query = np.array([1.0, 2.0, 3.0, 4.0])
+        trends = np.array([
+            [np.nan, np.nan, np.nan, 5.0],  # one shared lag, off by 1
+            [1.6, 2.6, 3.6, 4.6],           # every lag shared, each off by 0.6
+        ])
+        # Summing over the shared lags alone would rank the sparse row first (1.0 < 1.44)
+        self.assertEqual(top_k_similar(trends, query, 2).tolist(), [1, 0])
+
+    def test_rows_without_shared_lags_rank_last(self):
+        query = np.array([1.0, np.nan])
+        trends = np.array([
+            [np.nan, 1.0],
+            [10.0, np.nan],
+        ])
+        self.assertEqual(top_k_similar(trends, query, 2).tolist(), [1, 0])
+
+    def test_all_nan_query_keeps_frame_order(self):
+        query = np.array([np.nan, np.nan])
+        trends = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+        self.assertEqual(top_k_similar(trends, query, 2).tolist(), [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()